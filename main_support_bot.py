@@ -3,9 +3,21 @@ Main Support Bot Orchestrator
 Coordinates email handling, AI responses, and Slack notifications
 """
 
+import http.server
+import json
+import logging
+import logging.handlers
 import os
+import queue
+import secrets
+import signal
 import time
 import sqlite3
+import threading
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from datetime import datetime
 from typing import Dict, Optional
 from dotenv import load_dotenv
@@ -15,13 +27,95 @@ from shopify_integration import ShopifyIntegration
 from customer_support_agent import CustomerSupportAgent
 from slack_notifier import SlackNotifier
 from daily_summary import DailySummary
+from support_enums import Intent, Priority
 import pytz
 
+# PRAGMAs applied to every long-lived connection: WAL + NORMAL drops the
+# per-write fsync stall, busy_timeout rides out the daily-summary reader,
+# and the negative cache_size is ~20MB of page cache
+_DB_PRAGMAS = (
+    'journal_mode=WAL',
+    'synchronous=NORMAL',
+    'busy_timeout=5000',
+    'temp_store=MEMORY',
+    'cache_size=-20000'
+)
+
+# Hot statements as module constants: the same string object every call
+# means sqlite3's per-connection statement cache skips re-parsing and
+# re-planning the SQL
+_SQL_IS_PROCESSED = \
+    'SELECT 1 FROM processed_emails WHERE email_id = ? LIMIT 1'
+_SQL_INSERT_PROCESSED = '''
+    INSERT INTO processed_emails
+    (email_id, customer_email, subject, processed_at, response_sent,
+     flagged_for_review, order_number, intent)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_INSERT_REVIEW = '''
+    INSERT INTO human_review_queue (
+        email_id, order_number, customer_email, reason, priority, created_at
+    ) VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+
+logger = logging.getLogger('support_bot')
+
+
+def setup_logging(level=logging.INFO) -> logging.handlers.QueueListener:
+    """Route log records through a queue so formatting and the stdout
+    flush happen on a background thread, not in the email workers.
+    Returns the listener; callers should .stop() it on shutdown."""
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, logging.StreamHandler())
+    listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    return listener
+
+
+def _re_prefixed(subject: str) -> str:
+    """Prefix a reply subject with 'RE: ' unless it already has one"""
+    return subject if subject[:3].upper() == 'RE:' else f'RE: {subject}'
+
+
+def open_connection(db_path: str) -> sqlite3.Connection:
+    """Open a long-lived tuned SQLite connection (shared by the bot and
+    the review dashboard)"""
+    conn = sqlite3.connect(db_path, check_same_thread=False,
+                           isolation_level=None, cached_statements=256)
+    for pragma in _DB_PRAGMAS:
+        conn.execute(f'PRAGMA {pragma}')
+    return conn
+
+
 class SupportBot:
     def __init__(self, config: Dict):
         self.config = config
         self.db_path = config.get('db_path', 'support_bot.db')
 
+        # One connection for the bot's lifetime instead of a fresh
+        # open/lock/close per query; writes are serialized with a lock
+        self._conn = open_connection(self.db_path)
+        self._db_lock = threading.Lock()
+
+        # Writes are buffered per processing cycle and flushed in one
+        # transaction, collapsing N fsyncs into one
+        self._pending_processed = []
+        self._pending_reviews = []
+        # Mark-as-read calls are deferred too and sent as one Graph
+        # $batch at the end of the cycle
+        self._pending_read_ids = []
+
+        # LRU set of recently processed email IDs so the per-email dedupe
+        # check is a hash lookup, not a SQLite round-trip; bounded so
+        # memory stays flat. Preloaded from the DB in _init_database.
+        self._processed_ids = OrderedDict()
+        self._processed_ids_cap = 10000
+
         self.email_handler = OutlookEmailHandler(
             client_id=config['outlook_client_id'],
             client_secret=config['outlook_client_secret'],
@@ -41,8 +135,32 @@ class SupportBot:
         slack_url = config.get('slack_webhook_url')
         self.slack = SlackNotifier(slack_url) if slack_url else None
 
+        # Repeat lookups for the same (number, email) - a customer
+        # replying to a thread within a few minutes - hit memory instead
+        # of Shopify; the epoch bucket in the key expires entries after
+        # ~5 minutes without a timer thread
+        self._order_lookup = lru_cache(maxsize=512)(self._order_lookup_uncached)
+
         self.check_interval = config.get('check_interval_minutes', 5)
 
+        # Per-email work is almost all network wait (Shopify + Anthropic
+        # + Graph), so a small thread pool overlaps it across emails,
+        # and each cycle prefetches a full page of backlog to feed it
+        self.worker_threads = config.get('worker_threads', 5)
+        self.batch_size = config.get('batch_size', 50)
+
+        # Push instead of poll: when a public webhook_url is configured,
+        # a Graph subscription pings the receiver on new mail and sets
+        # this event so run_continuous wakes immediately. Polling stays
+        # as the fallback when no webhook is configured or renewal fails.
+        self._wakeup = threading.Event()
+        self._shutdown = False
+        self.webhook_url = config.get('webhook_url')
+        self.webhook_port = config.get('webhook_port', 8080)
+        self._webhook_state = secrets.token_hex(16)
+        self._subscription = None
+        self._subscription_renew_at = 0.0
+
         # Daily summary configuration
         self.summary_email = config.get('summary_email')
         self.summary_hour = config.get('summary_hour', 8)  # 8 AM
@@ -56,8 +174,7 @@ class SupportBot:
 
     def _init_database(self):
         """Initialize SQLite database for tracking"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
 
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS processed_emails (
@@ -68,7 +185,7 @@ class SupportBot:
                 response_sent BOOLEAN,
                 flagged_for_review BOOLEAN,
                 order_number TEXT,
-                intent TEXT
+                intent INTEGER
             )
         ''')
 
@@ -79,7 +196,7 @@ class SupportBot:
                 order_number TEXT,
                 customer_email TEXT,
                 reason TEXT,
-                priority TEXT,
+                priority INTEGER,
                 created_at TEXT,
                 resolved_at TEXT,
                 resolved_by TEXT,
@@ -87,54 +204,70 @@ class SupportBot:
             )
         ''')
 
-        conn.commit()
-        conn.close()
+        # Dashboard pulls pending reviews ordered by priority/created_at,
+        # and the stats queries count on response_sent; index both so
+        # neither scans the full table as history grows
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_review_status_priority
+                ON human_review_queue(status, priority, created_at)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_processed_response_sent
+                ON processed_emails(response_sent)
+        ''')
+
+        # Warm the dedupe cache with the most recent IDs
+        cursor.execute('''
+            SELECT email_id FROM processed_emails
+            ORDER BY processed_at DESC LIMIT ?
+        ''', (self._processed_ids_cap,))
+        for (email_id,) in cursor:
+            self._processed_ids[email_id] = None
+
+        logger.info(f"✅ Database initialized: {self.db_path}")
 
-        print(f"✅ Database initialized: {self.db_path}")
+    def _remember_processed(self, email_id: str):
+        """Record an ID in the dedupe cache, evicting the oldest at cap"""
+        self._processed_ids[email_id] = None
+        self._processed_ids.move_to_end(email_id)
+        if len(self._processed_ids) > self._processed_ids_cap:
+            self._processed_ids.popitem(last=False)
 
     def is_email_processed(self, email_id: str) -> bool:
         """Check if email was already processed"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT email_id FROM processed_emails WHERE email_id = ?', (email_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
+        with self._db_lock:
+            # Hot path: recently seen IDs (including rows buffered this
+            # cycle) resolve in memory
+            if email_id in self._processed_ids:
+                self._processed_ids.move_to_end(email_id)
+                return True
+            # Cache miss: SELECT 1 keeps the fallback a bare B-tree probe
+            # on the primary key with no row payload materialized
+            cursor = self._conn.execute(_SQL_IS_PROCESSED, (email_id,))
+            found = cursor.fetchone() is not None
+            if found:
+                self._remember_processed(email_id)
+            return found
 
     def mark_email_processed(self, email_id: str, customer_email: str, subject: str,
                             response_sent: bool, flagged: bool, order_number: str = None,
                             intent: str = None):
-        """Mark email as processed in database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            INSERT INTO processed_emails
-            (email_id, customer_email, subject, processed_at, response_sent,
-             flagged_for_review, order_number, intent)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (email_id, customer_email, subject, datetime.now().isoformat(),
-              response_sent, flagged, order_number, intent))
-
-        conn.commit()
-        conn.close()
+        """Queue email as processed; written out at the end of the cycle"""
+        with self._db_lock:
+            self._pending_processed.append(
+                (email_id, customer_email, subject, datetime.now(pytz.UTC).isoformat(),
+                 response_sent, flagged, order_number, Intent.encode(intent)))
+            self._remember_processed(email_id)
 
     def add_to_review_queue(self, email_id: str, order_number: str,
                            customer_email: str, reason: str, priority: str = 'medium'):
-        """Add email to human review queue and notify via Slack"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Queue email for human review and notify via Slack"""
+        with self._db_lock:
+            self._pending_reviews.append(
+                (email_id, order_number, customer_email, reason,
+                 Priority.encode(priority), datetime.now(pytz.UTC).isoformat()))
 
-        cursor.execute('''
-            INSERT INTO human_review_queue (
-                email_id, order_number, customer_email, reason, priority, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?)
-        ''', (email_id, order_number, customer_email, reason, priority, datetime.now().isoformat()))
-
-        conn.commit()
-        conn.close()
-
-        print(f"⚠️  FLAGGED FOR REVIEW: {reason} - Order #{order_number}")
+        logger.warning(f"⚠️  FLAGGED FOR REVIEW: {reason} - Order #{order_number}")
 
         if self.slack:
             self.slack.notify_human_review_needed(
@@ -144,6 +277,39 @@ class SupportBot:
                 priority=priority
             )
 
+    def _flush_pending_writes(self):
+        """Write all rows buffered during the cycle in one transaction.
+
+        BEGIN IMMEDIATE takes the write lock up front so the whole batch
+        rides a single fsync; Slack/network calls never happen inside it.
+        """
+        with self._db_lock:
+            if not self._pending_processed and not self._pending_reviews:
+                return
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(_SQL_INSERT_PROCESSED,
+                                       self._pending_processed)
+                self._conn.executemany(_SQL_INSERT_REVIEW,
+                                       self._pending_reviews)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._pending_processed.clear()
+            self._pending_reviews.clear()
+
+    def _order_lookup_uncached(self, order_number: Optional[str],
+                               email: str, _bucket: int) -> Optional[Dict]:
+        """Shopify lookup behind the LRU cache; _bucket only varies the
+        cache key so entries age out"""
+        return self.shopify.find_order_for_email(order_number, email)
+
+    def _defer_mark_as_read(self, email_id: str):
+        """Queue an email for the end-of-cycle bulk mark-as-read"""
+        with self._db_lock:
+            self._pending_read_ids.append(email_id)
+
     def process_email(self, email: Dict) -> bool:
         """
         Process a single email
@@ -152,44 +318,42 @@ class SupportBot:
         email_id = email['id']
 
         if self.is_email_processed(email_id):
-            print(f"⏭️  Skipping already processed email: {email['subject']}")
+            logger.info(f"⏭️  Skipping already processed email: {email['subject']}")
             return True
 
-        print(f"\n📧 Processing: {email['subject']}")
-        print(f"   From: {email['from_name']} <{email['from_email']}>")
+        logger.info(f"\n📧 Processing: {email['subject']}")
+        logger.info(f"   From: {email['from_name']} <{email['from_email']}>")
 
         customer_email = email['from_email']
         customer_name = email['from_name'] or 'Valued Customer'
         email_subject = email['subject']
-        email_body = email['body']
 
         is_blocked, block_reason = self.ai_agent.is_blocked_sender(customer_email, customer_name)
         if is_blocked:
-            print(f"   🚫 BLOCKED: {block_reason}")
+            logger.info(f"   🚫 BLOCKED: {block_reason}")
             self.mark_email_processed(email_id, customer_email, email_subject,
                                      False, False, None, 'blocked_sender')
-            self.email_handler.mark_as_read(email_id)
+            self._defer_mark_as_read(email_id)
             return True
 
-        order_number = self.ai_agent.extract_order_number(email_subject + " " + email_body)
-        order_context = None
+        # Bodies are excluded from the list call; only pull one down
+        # once the sender cleared the cheap blocked-sender filter
+        email_body = email.get('body')
+        if email_body is None:
+            body = self.email_handler.get_message_body(email_id)
+            email_body = body['content'] if body else ''
 
+        order_number = self.ai_agent.extract_order_number(email_subject + " " + email_body)
         if order_number:
-            print(f"   🔍 Found order number: #{order_number}")
-            order_context = self.shopify.find_order_by_number(order_number)
-
-            if not order_context:
-                orders = self.shopify.find_order_by_email(customer_email)
-                if orders:
-                    order_context = orders[0]
-                    order_number = order_context['order_number']
-                    print(f"   📦 Matched by email to order #{order_number}")
-        else:
-            orders = self.shopify.find_order_by_email(customer_email, limit=1)
-            if orders:
-                order_context = orders[0]
-                order_number = order_context['order_number']
-                print(f"   📦 Found order by email: #{order_number}")
+            logger.info(f"   🔍 Found order number: #{order_number}")
+
+        # One combined lookup instead of a number query plus an email
+        # fallback round-trip, memoized for ~5 minutes
+        order_context = self._order_lookup(order_number, customer_email,
+                                           int(time.time() // 300))
+        if order_context and order_context['order_number'] != order_number:
+            order_number = order_context['order_number']
+            logger.info(f"   📦 Matched by email to order #{order_number}")
 
         ai_response = self.ai_agent.generate_response(
             customer_email=customer_email,
@@ -200,14 +364,14 @@ class SupportBot:
         )
 
         if ai_response['type'] == 'spam':
-            print(f"   🗑️  SPAM: {ai_response['reason']}")
+            logger.info(f"   🗑️  SPAM: {ai_response['reason']}")
             self.mark_email_processed(email_id, customer_email, email_subject,
                                      False, False, order_number, 'spam')
-            self.email_handler.mark_as_read(email_id)
+            self._defer_mark_as_read(email_id)
             return True
 
         if ai_response['flag_for_human']:
-            print(f"   🚩 Flagged for review: {ai_response['human_review_reason']}")
+            logger.info(f"   🚩 Flagged for review: {ai_response['human_review_reason']}")
 
             priority = 'high' if 'overdue' in ai_response['human_review_reason'].lower() else 'medium'
 
@@ -221,11 +385,11 @@ class SupportBot:
 
             self.mark_email_processed(email_id, customer_email, email_subject,
                                      False, True, order_number, ai_response.get('intent'))
-            self.email_handler.mark_as_read(email_id)
+            self._defer_mark_as_read(email_id)
             return True
 
         if ai_response['should_send'] and ai_response['response']:
-            reply_subject = email_subject if email_subject.startswith('RE:') else f"RE: {email_subject}"
+            reply_subject = _re_prefixed(email_subject)
 
             success = self.email_handler.send_reply(
                 to_email=customer_email,
@@ -235,50 +399,66 @@ class SupportBot:
             )
 
             if success:
-                print(f"   ✅ AI response sent")
-                self.email_handler.mark_as_read(email_id)
+                logger.info(f"   ✅ AI response sent")
+                self._defer_mark_as_read(email_id)
                 self.mark_email_processed(email_id, customer_email, email_subject,
                                          True, False, order_number, ai_response.get('intent'))
                 return True
             else:
-                print(f"   ❌ Failed to send response")
+                logger.error(f"   ❌ Failed to send response")
                 return False
 
         return True
 
+    def _process_email_safe(self, email: Dict) -> bool:
+        """process_email wrapped for pool workers: never raises, reports
+        failures to Slack like the old sequential loop did"""
+        try:
+            return self.process_email(email)
+        except Exception as e:
+            logger.error(f"❌ Error processing email: {e}")
+            if self.slack:
+                self.slack.notify_error(
+                    error_message=str(e),
+                    context=f"Email: {email.get('subject', 'Unknown')}"
+                )
+            return False
+
     def run_once(self):
         """Run one cycle of email processing"""
-        print(f"\n{'='*60}")
-        print(f"🤖 Support Bot Check - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"{'='*60}")
+        logger.info(f"\n{'='*60}")
+        logger.info(f"🤖 Support Bot Check - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        logger.info(f"{'='*60}")
 
         if not self.email_handler.authenticate():
-            print("❌ Failed to authenticate with Outlook")
+            logger.error("❌ Failed to authenticate with Outlook")
             if self.slack:
                 self.slack.notify_error("Failed to authenticate with Outlook")
             return
 
-        emails = self.email_handler.get_unread_emails(limit=10)
-        print(f"\n📬 Found {len(emails)} unread emails")
+        emails = self.email_handler.get_unread_emails(limit=self.batch_size,
+                                                      include_body=False)
+        logger.info(f"\n📬 Found {len(emails)} unread emails")
 
         if not emails:
-            print("✅ No new emails to process")
+            logger.info("✅ No new emails to process")
             return
 
         processed = 0
-        for email in emails:
-            try:
-                if self.process_email(email):
-                    processed += 1
-            except Exception as e:
-                print(f"❌ Error processing email: {e}")
-                if self.slack:
-                    self.slack.notify_error(
-                        error_message=str(e),
-                        context=f"Email: {email.get('subject', 'Unknown')}"
-                    )
-
-        print(f"\n✅ Processed {processed}/{len(emails)} emails")
+        try:
+            with ThreadPoolExecutor(max_workers=self.worker_threads) as executor:
+                futures = [executor.submit(self._process_email_safe, email)
+                           for email in emails]
+                for future in as_completed(futures):
+                    if future.result():
+                        processed += 1
+        finally:
+            self._flush_pending_writes()
+            with self._db_lock:
+                read_ids, self._pending_read_ids = self._pending_read_ids, []
+            self.email_handler.batch_mark_as_read(read_ids)
+
+        logger.info(f"\n✅ Processed {processed}/{len(emails)} emails")
 
     def check_and_send_daily_summary(self):
         """Check if it's time to send daily summary and send if needed"""
@@ -293,52 +473,138 @@ class SupportBot:
         # Check if we should send summary
         # Send at configured hour, but only once per day
         if current_hour == self.summary_hour and self.last_summary_date != current_date:
-            print(f"\n📊 Sending daily summary to {self.summary_email}...")
+            logger.info(f"\n📊 Sending daily summary to {self.summary_email}...")
             try:
                 success = self.daily_summary.send_daily_summary(self.summary_email)
                 if success:
                     self.last_summary_date = current_date
-                    print("✅ Daily summary sent successfully")
+                    logger.info("✅ Daily summary sent successfully")
                 else:
-                    print("❌ Failed to send daily summary")
+                    logger.error("❌ Failed to send daily summary")
             except Exception as e:
-                print(f"❌ Error sending daily summary: {e}")
+                logger.error(f"❌ Error sending daily summary: {e}")
                 if self.slack:
                     self.slack.notify_error(
                         error_message=str(e),
                         context="Daily summary error"
                     )
 
+    def _start_webhook_receiver(self):
+        """Serve Graph change notifications on webhook_port; each
+        validated new-mail ping wakes the main loop immediately"""
+        bot = self
+
+        class NotificationHandler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                query = urllib.parse.urlparse(self.path).query
+                token = urllib.parse.parse_qs(query).get('validationToken')
+                if token:
+                    # Subscription handshake: echo the token as plain text
+                    body = token[0].encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain')
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                length = int(self.headers.get('Content-Length', 0))
+                raw = self.rfile.read(length)
+                self.send_response(202)
+                self.end_headers()
+
+                try:
+                    notifications = json.loads(raw).get('value', [])
+                except ValueError:
+                    return
+                for note in notifications:
+                    if note.get('clientState') == bot._webhook_state:
+                        bot._wakeup.set()
+                        break
+
+            def log_message(self, *args):
+                pass  # keep notification chatter out of the log queue
+
+        server = http.server.ThreadingHTTPServer(
+            ('', self.webhook_port), NotificationHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"📡 Webhook receiver listening on port {self.webhook_port}")
+        return server
+
+    def _ensure_subscription(self):
+        """Create or renew the Graph new-mail subscription; on failure
+        the bot just keeps polling at check_interval"""
+        if not self.webhook_url or time.time() < self._subscription_renew_at:
+            return
+
+        if self._subscription:
+            if self.email_handler.renew_subscription(self._subscription['id']):
+                self._subscription_renew_at = time.time() + 3600
+                return
+            self._subscription = None
+
+        self._subscription = self.email_handler.create_subscription(
+            self.webhook_url, client_state=self._webhook_state)
+        if self._subscription:
+            self._subscription_renew_at = time.time() + 3600
+            logger.info(f"📡 Subscribed to new-mail notifications "
+                        f"({self._subscription.get('id')})")
+        else:
+            # Retry on the next cycle; polling covers the gap
+            logger.warning("⚠️  Could not create Graph subscription, "
+                           "falling back to polling")
+
+    def request_shutdown(self, *_):
+        """Ask the main loop to exit; wakes it immediately instead of
+        letting it sleep out the rest of the poll interval"""
+        self._shutdown = True
+        self._wakeup.set()
+
     def run_continuous(self):
         """Run bot continuously with configured interval"""
-        print("="*60)
-        print("🤖 Support Bot Started")
-        print(f"Check interval: {self.check_interval} minutes")
-        print(f"Database: {self.db_path}")
-        print("="*60)
+        logger.info("="*60)
+        logger.info("🤖 Support Bot Started")
+        logger.info(f"Check interval: {self.check_interval} minutes")
+        logger.info(f"Database: {self.db_path}")
+        logger.info("="*60)
+
+        try:
+            signal.signal(signal.SIGTERM, self.request_shutdown)
+        except ValueError:
+            pass  # not the main thread (e.g. embedded in a test harness)
 
-        while True:
+        if self.webhook_url:
+            self._start_webhook_receiver()
+
+        while not self._shutdown:
             try:
+                self._ensure_subscription()
                 self.run_once()
                 self.check_and_send_daily_summary()
-                print(f"\n💤 Sleeping for {self.check_interval} minutes...")
-                time.sleep(self.check_interval * 60)
+                logger.info(f"\n💤 Waiting up to {self.check_interval} minutes...")
+                # Wakes early on new mail or a shutdown signal
+                if self._wakeup.wait(self.check_interval * 60):
+                    self._wakeup.clear()
 
             except KeyboardInterrupt:
-                print("\n\n👋 Support Bot stopped by user")
+                logger.info("\n\n👋 Support Bot stopped by user")
                 break
             except Exception as e:
-                print(f"\n❌ Error in main loop: {e}")
+                logger.error(f"\n❌ Error in main loop: {e}")
                 if self.slack:
                     self.slack.notify_error(
                         error_message=str(e),
                         context="Main loop error"
                     )
-                time.sleep(60)
+                self._wakeup.wait(60)
+                self._wakeup.clear()
+
+        if self._shutdown:
+            logger.info("\n👋 Support Bot stopped (shutdown requested)")
 
 
 def main():
     load_dotenv()
+    listener = setup_logging()
 
     config = {
         'outlook_client_id': os.getenv('OUTLOOK_CLIENT_ID'),
@@ -351,9 +617,12 @@ def main():
         'slack_webhook_url': os.getenv('SLACK_WEBHOOK_URL'),
         'db_path': os.getenv('DB_PATH', 'support_bot.db'),
         'check_interval_minutes': int(os.getenv('CHECK_INTERVAL_MINUTES', '5')),
+        'batch_size': int(os.getenv('EMAIL_BATCH_SIZE', '50')),
         'summary_email': os.getenv('SUMMARY_EMAIL'),
         'summary_hour': int(os.getenv('SUMMARY_HOUR', '8')),
-        'summary_timezone': os.getenv('SUMMARY_TIMEZONE', 'America/Chicago')
+        'summary_timezone': os.getenv('SUMMARY_TIMEZONE', 'America/Chicago'),
+        'webhook_url': os.getenv('WEBHOOK_URL'),
+        'webhook_port': int(os.getenv('WEBHOOK_PORT', '8080'))
     }
 
     required = ['outlook_client_id', 'outlook_client_secret', 'outlook_tenant_id',
@@ -361,12 +630,16 @@ def main():
 
     missing = [key for key in required if not config[key]]
     if missing:
-        print(f"❌ Missing required environment variables: {', '.join(missing)}")
-        print("Please check your .env file")
+        logger.error(f"❌ Missing required environment variables: {', '.join(missing)}")
+        logger.info("Please check your .env file")
+        listener.stop()
         return
 
-    bot = SupportBot(config)
-    bot.run_continuous()
+    try:
+        bot = SupportBot(config)
+        bot.run_continuous()
+    finally:
+        listener.stop()
 
 
 if __name__ == "__main__":
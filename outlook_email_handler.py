@@ -3,20 +3,80 @@ Outlook Email Handler using Microsoft Graph API
 Handles authentication, fetching emails, sending replies
 """
 
+import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 import os
 
+# (connect, read) timeout for every Graph call: a hung socket should
+# surface as an error, not stall the whole processing cycle
+DEFAULT_TIMEOUT = (3.05, 15)
+
+
 class OutlookEmailHandler:
-    def __init__(self, client_id: str, client_secret: str, tenant_id: str, support_email: str, signature_path: str = 'signature.html'):
+    def __init__(self, client_id: str, client_secret: str, tenant_id: str, support_email: str, signature_path: str = 'signature.html',
+                 token_cache_path: str = '.graph_token.json'):
         self.client_id = client_id
         self.client_secret = client_secret
         self.tenant_id = tenant_id
         self.support_email = support_email
         self.access_token = None
         self.token_expiry = None
+        self.token_cache_path = token_cache_path
         self.signature_html = self._load_signature(signature_path)
+        # Signature is a multi-KB HTML block appended to every send;
+        # pre-slot it into a template so send_reply does one format call
+        # instead of re-concatenating it each time. Braces are escaped in
+        # case the signature carries inline CSS.
+        self._body_template = ('{body}' + self.signature_html
+                               .replace('{', '{{').replace('}', '}}')).format
+
+        # One pooled session for all Graph calls - keep-alive amortizes
+        # the TCP+TLS handshake, and transient 429/5xx responses retry
+        # with backoff instead of failing the call
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=3, backoff_factor=0.3,
+                              status_forcelist=[429, 500, 502, 503, 504])
+        ))
+
+        self._load_cached_token()
+        if self.access_token:
+            self.session.headers['Authorization'] = f'Bearer {self.access_token}'
+
+    def _load_cached_token(self):
+        """
+        Reuse a token persisted by a previous run if it hasn't expired,
+        skipping the round-trip to login.microsoftonline.com on restart
+        """
+        try:
+            with open(self.token_cache_path, 'r') as f:
+                cached = json.load(f)
+            expiry = datetime.fromisoformat(cached['expiry'])
+            if datetime.now() < expiry:
+                self.access_token = cached['token']
+                self.token_expiry = expiry
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save_cached_token(self):
+        """
+        Persist the current token for future runs (0600 - it grants
+        mailbox access)
+        """
+        try:
+            fd = os.open(self.token_cache_path,
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'token': self.access_token,
+                           'expiry': self.token_expiry.isoformat()}, f)
+        except OSError as e:
+            print(f"Warning: could not cache Graph token: {e}")
 
     def _load_signature(self, signature_path: str) -> str:
         """
@@ -51,13 +111,16 @@ class OutlookEmailHandler:
         }
 
         try:
-            response = requests.post(token_url, data=token_data)
+            response = self.session.post(token_url, data=token_data,
+                                         timeout=DEFAULT_TIMEOUT)
             response.raise_for_status()
 
             token_response = response.json()
             self.access_token = token_response['access_token']
             expires_in = token_response.get('expires_in', 3600)
             self.token_expiry = datetime.now() + timedelta(seconds=expires_in - 60)
+            self.session.headers['Authorization'] = f'Bearer {self.access_token}'
+            self._save_cached_token()
 
             return True
 
@@ -65,18 +128,24 @@ class OutlookEmailHandler:
             print(f"Authentication error: {e}")
             return False
 
-    def get_unread_emails(self, limit: int = 10) -> List[Dict]:
+    def iter_unread_pages(self, limit: int = 50, include_body: bool = True):
         """
-        Fetch unread emails from inbox
-        Returns list of email dictionaries
+        Yield unread inbox emails one Graph page at a time, following
+        @odata.nextLink until limit messages are yielded. Streaming
+        pages lets callers start processing the first page while the
+        next one is still in flight.
+
+        With include_body=False the list call skips message bodies
+        (they dominate the payload); callers fetch them lazily with
+        get_message_body once the sender passed the cheap filters
         """
         if not self.authenticate():
-            return []
+            return
 
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
+        if include_body:
+            select = 'id,subject,from,receivedDateTime,body,toRecipients,conversationId'
+        else:
+            select = 'id,subject,from,receivedDateTime,conversationId'
 
         # Filter for unread emails only
         url = f"https://graph.microsoft.com/v1.0/users/{self.support_email}/messages"
@@ -84,33 +153,81 @@ class OutlookEmailHandler:
             '$filter': 'isRead eq false',
             '$top': limit,
             '$orderby': 'receivedDateTime desc',
-            '$select': 'id,subject,from,receivedDateTime,body,toRecipients,conversationId'
+            '$select': select
         }
 
+        yielded = 0
+
         try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
+            while url and yielded < limit:
+                response = self.session.get(url, params=params,
+                                            timeout=DEFAULT_TIMEOUT)
+                response.raise_for_status()
+
+                payload = response.json()
+                page = []
+                for email in payload.get('value', []):
+                    body = email.get('body')
+                    page.append({
+                        'id': email['id'],
+                        'subject': email['subject'],
+                        'from_email': email['from']['emailAddress']['address'],
+                        'from_name': email['from']['emailAddress'].get('name', ''),
+                        'received_time': email['receivedDateTime'],
+                        'body': body['content'] if body else None,
+                        'body_type': body['contentType'] if body else None,
+                        'conversation_id': email.get('conversationId', '')
+                    })
+                    if yielded + len(page) >= limit:
+                        break
+
+                if page:
+                    yielded += len(page)
+                    yield page
+
+                # nextLink already carries the query string
+                url = payload.get('@odata.nextLink')
+                params = None
 
-            emails = response.json().get('value', [])
+        except Exception as e:
+            print(f"Error fetching emails: {e}")
 
-            processed_emails = []
-            for email in emails:
-                processed_emails.append({
-                    'id': email['id'],
-                    'subject': email['subject'],
-                    'from_email': email['from']['emailAddress']['address'],
-                    'from_name': email['from']['emailAddress'].get('name', ''),
-                    'received_time': email['receivedDateTime'],
-                    'body': email['body']['content'],
-                    'body_type': email['body']['contentType'],
-                    'conversation_id': email.get('conversationId', '')
-                })
+    def get_unread_emails(self, limit: int = 50, include_body: bool = True) -> List[Dict]:
+        """
+        Fetch unread emails from inbox (all pages gathered into one
+        list; see iter_unread_pages for the streaming variant)
+        Returns list of email dictionaries
+        """
+        processed_emails = []
+        for page in self.iter_unread_pages(limit, include_body):
+            processed_emails.extend(page)
+        return processed_emails
 
-            return processed_emails
+    def get_message_body(self, message_id: str) -> Optional[Dict]:
+        """
+        Fetch just the body of a single message
+        Returns {'content': ..., 'content_type': ...} or None
+        """
+        if not self.authenticate():
+            return None
+
+        url = f"https://graph.microsoft.com/v1.0/users/{self.support_email}/messages/{message_id}"
+        params = {'$select': 'body'}
+
+        try:
+            response = self.session.get(url, params=params,
+                                        timeout=DEFAULT_TIMEOUT)
+            response.raise_for_status()
+
+            body = response.json().get('body', {})
+            return {
+                'content': body.get('content', ''),
+                'content_type': body.get('contentType', 'html')
+            }
 
         except Exception as e:
-            print(f"Error fetching emails: {e}")
-            return []
+            print(f"Error fetching message body: {e}")
+            return None
 
     def send_reply(self, to_email: str, subject: str, body: str,
                    original_message_id: Optional[str] = None) -> bool:
@@ -121,18 +238,13 @@ class OutlookEmailHandler:
         if not self.authenticate():
             return False
 
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
-
         # Append signature to body
-        body_with_signature = body + self.signature_html
+        body_with_signature = self._body_template(body=body)
 
         # Construct email
         email_msg = {
             'message': {
-                'subject': subject if not subject.startswith('RE:') else subject,
+                'subject': subject,
                 'body': {
                     'contentType': 'HTML',
                     'content': body_with_signature
@@ -156,7 +268,8 @@ class OutlookEmailHandler:
             url = f"https://graph.microsoft.com/v1.0/users/{self.support_email}/sendMail"
 
         try:
-            response = requests.post(url, headers=headers, json=email_msg)
+            response = self.session.post(url, json=email_msg,
+                                         timeout=DEFAULT_TIMEOUT)
             response.raise_for_status()
             return True
 
@@ -171,18 +284,13 @@ class OutlookEmailHandler:
         if not self.authenticate():
             return False
 
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
-
         url = f"https://graph.microsoft.com/v1.0/users/{self.support_email}/messages/{message_id}"
         data = {
             'isRead': True
         }
 
         try:
-            response = requests.patch(url, headers=headers, json=data)
+            response = self.session.patch(url, json=data, timeout=DEFAULT_TIMEOUT)
             response.raise_for_status()
             return True
 
@@ -190,6 +298,106 @@ class OutlookEmailHandler:
             print(f"Error marking email as read: {e}")
             return False
 
+    def batch_mark_as_read(self, message_ids: List[str]) -> bool:
+        """
+        Mark many emails as read with Graph $batch envelopes
+        (20 sub-requests each) instead of one PATCH per message
+        """
+        if not message_ids:
+            return True
+
+        if not self.authenticate():
+            return False
+
+        url = "https://graph.microsoft.com/v1.0/$batch"
+        all_ok = True
+
+        for start in range(0, len(message_ids), 20):
+            chunk = message_ids[start:start + 20]
+            envelope = {
+                'requests': [
+                    {
+                        'id': str(i),
+                        'method': 'PATCH',
+                        'url': f"/users/{self.support_email}/messages/{mid}",
+                        'body': {'isRead': True},
+                        'headers': {'Content-Type': 'application/json'}
+                    }
+                    for i, mid in enumerate(chunk)
+                ]
+            }
+
+            try:
+                response = self.session.post(url, json=envelope,
+                                             timeout=DEFAULT_TIMEOUT)
+                response.raise_for_status()
+
+                for sub in response.json().get('responses', []):
+                    if sub.get('status', 500) >= 400:
+                        print(f"Error marking email as read in batch: "
+                              f"{sub.get('status')} {sub.get('body')}")
+                        all_ok = False
+
+            except Exception as e:
+                print(f"Error sending mark-as-read batch: {e}")
+                all_ok = False
+
+        return all_ok
+
+    def create_subscription(self, notification_url: str,
+                            expiration_minutes: int = 4230,
+                            client_state: str = '') -> Optional[Dict]:
+        """
+        Subscribe to change notifications for new inbox messages, so the
+        bot gets pushed instead of polling an empty mailbox
+        Returns the subscription resource or None
+        """
+        if not self.authenticate():
+            return None
+
+        expiry = datetime.utcnow() + timedelta(minutes=expiration_minutes)
+        payload = {
+            'changeType': 'created',
+            'notificationUrl': notification_url,
+            'resource': f"users/{self.support_email}/mailFolders/inbox/messages",
+            'expirationDateTime': expiry.strftime('%Y-%m-%dT%H:%M:%S.0000000Z'),
+            'clientState': client_state
+        }
+
+        try:
+            response = self.session.post(
+                "https://graph.microsoft.com/v1.0/subscriptions", json=payload,
+                timeout=DEFAULT_TIMEOUT)
+            response.raise_for_status()
+            return response.json()
+
+        except Exception as e:
+            print(f"Error creating subscription: {e}")
+            return None
+
+    def renew_subscription(self, subscription_id: str,
+                           expiration_minutes: int = 4230) -> bool:
+        """
+        Push a subscription's expiration out; Graph caps mail
+        subscriptions at about three days so this runs periodically
+        """
+        if not self.authenticate():
+            return False
+
+        expiry = datetime.utcnow() + timedelta(minutes=expiration_minutes)
+        url = f"https://graph.microsoft.com/v1.0/subscriptions/{subscription_id}"
+
+        try:
+            response = self.session.patch(url, json={
+                'expirationDateTime': expiry.strftime('%Y-%m-%dT%H:%M:%S.0000000Z')
+            }, timeout=DEFAULT_TIMEOUT)
+            response.raise_for_status()
+            return True
+
+        except Exception as e:
+            print(f"Error renewing subscription: {e}")
+            return False
+
     def get_attachments(self, message_id: str) -> List[Dict]:
         """
         Get attachments from an email
@@ -197,15 +405,10 @@ class OutlookEmailHandler:
         if not self.authenticate():
             return []
 
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
-
         url = f"https://graph.microsoft.com/v1.0/users/{self.support_email}/messages/{message_id}/attachments"
 
         try:
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url, timeout=DEFAULT_TIMEOUT)
             response.raise_for_status()
 
             attachments = response.json().get('value', [])
@@ -9,46 +9,51 @@ from datetime import datetime
 from typing import List, Dict
 import os
 from dotenv import load_dotenv
+from support_enums import Priority
+
+# Priority markers for the review listing
+PRIORITY_EMOJI = {
+    'high': '🔴',
+    'medium': '🟡',
+    'low': '🟢'
+}
+
 
 class ReviewDashboard:
-    def __init__(self, db_path: str = 'support_bot.db'):
+    def __init__(self, db_path: str = 'support_bot.db', conn: sqlite3.Connection = None):
         self.db_path = db_path
+        # One connection for the dashboard's lifetime (or an injected
+        # shared one), instead of a fresh open/close per query
+        if conn is None:
+            from main_support_bot import open_connection
+            conn = open_connection(db_path)
+        conn.row_factory = sqlite3.Row
+        self._conn = conn
 
     def get_pending_reviews(self) -> List[Dict]:
         """Get all pending items in review queue"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        cursor.execute('''
+        cursor = self._conn.execute('''
             SELECT * FROM human_review_queue
             WHERE status = 'pending'
             ORDER BY priority DESC, created_at ASC
         ''')
 
-        reviews = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-
-        return reviews
+        return [dict(row) for row in cursor.fetchall()]
 
     def get_review_stats(self) -> Dict:
         """Get statistics about reviews"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT COUNT(*) FROM human_review_queue WHERE status = "pending"')
-        pending = cursor.fetchone()[0]
-
-        cursor.execute('SELECT COUNT(*) FROM human_review_queue WHERE status = "resolved"')
-        resolved = cursor.fetchone()[0]
-
-        cursor.execute('SELECT COUNT(*) FROM processed_emails WHERE response_sent = 1')
-        automated = cursor.fetchone()[0]
-
-        cursor.execute('SELECT COUNT(*) FROM processed_emails')
-        total = cursor.fetchone()[0]
-
-        conn.close()
+        # All four counts in one statement: the queue counts ride the
+        # status index as scalar subqueries, the email counts come from
+        # a single pass over processed_emails
+        cursor = self._conn.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM human_review_queue WHERE status = 'pending'),
+                (SELECT COUNT(*) FROM human_review_queue WHERE status = 'resolved'),
+                COALESCE(SUM(CASE WHEN response_sent = 1 THEN 1 ELSE 0 END), 0),
+                COUNT(*)
+            FROM processed_emails
+        ''')
+        pending, resolved, automated, total = cursor.fetchone()
 
         automation_rate = (automated / total * 100) if total > 0 else 0
 
@@ -62,19 +67,14 @@ class ReviewDashboard:
 
     def mark_resolved(self, review_id: int, resolved_by: str = 'manual'):
         """Mark a review item as resolved"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
+        self._conn.execute('''
             UPDATE human_review_queue
             SET status = 'resolved',
                 resolved_at = ?,
                 resolved_by = ?
             WHERE id = ?
         ''', (datetime.now().isoformat(), resolved_by, review_id))
-
-        conn.commit()
-        conn.close()
+        self._conn.commit()
 
         print(f"✅ Review #{review_id} marked as resolved")
 
@@ -104,18 +104,16 @@ class ReviewDashboard:
         print("\n🚩 PENDING REVIEWS")
         print("-"*70)
 
+        now = datetime.now()
         for review in reviews:
-            priority_emoji = {
-                'high': '🔴',
-                'medium': '🟡',
-                'low': '🟢'
-            }
-
-            emoji = priority_emoji.get(review['priority'], '🟡')
+            priority = Priority.decode(review['priority'])
+            emoji = PRIORITY_EMOJI.get(priority, '🟡')
             created = datetime.fromisoformat(review['created_at'])
-            age = (datetime.now() - created).total_seconds() / 3600
+            # created_at is stored in UTC; legacy rows may be naive local time
+            reference = now.astimezone(created.tzinfo) if created.tzinfo else now
+            age = (reference - created).total_seconds() / 3600
 
-            print(f"\n{emoji} Review ID: {review['id']} | Priority: {review['priority'].upper()}")
+            print(f"\n{emoji} Review ID: {review['id']} | Priority: {priority.upper()}")
             print(f"   Order:     #{review['order_number']}")
             print(f"   Customer:  {review['customer_email']}")
             print(f"   Reason:    {review['reason']}")
@@ -127,27 +125,35 @@ class ReviewDashboard:
 
     def get_email_details(self, review_id: int) -> Dict:
         """Get full details for a review item"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT * FROM human_review_queue WHERE id = ?', (review_id,))
-        review = cursor.fetchone()
-
-        if not review:
-            conn.close()
+        # One LEFT JOIN instead of two round-trips: a PK probe on the
+        # queue and a PK probe on processed_emails, one row back
+        cursor = self._conn.execute('''
+            SELECT r.*,
+                   p.email_id AS e_email_id,
+                   p.customer_email AS e_customer_email,
+                   p.subject AS e_subject,
+                   p.processed_at AS e_processed_at,
+                   p.response_sent AS e_response_sent,
+                   p.flagged_for_review AS e_flagged_for_review,
+                   p.order_number AS e_order_number,
+                   p.intent AS e_intent
+            FROM human_review_queue r
+            LEFT JOIN processed_emails p ON r.email_id = p.email_id
+            WHERE r.id = ?
+        ''', (review_id,))
+        row = cursor.fetchone()
+
+        if not row:
             return None
 
-        review_dict = dict(review)
-        email_id = review_dict['email_id']
-
-        cursor.execute('SELECT * FROM processed_emails WHERE email_id = ?', (email_id,))
-        email = cursor.fetchone()
-
-        conn.close()
+        combined = dict(row)
+        review_dict = {key: value for key, value in combined.items()
+                       if not key.startswith('e_')}
 
-        if email:
-            review_dict['email_details'] = dict(email)
+        if combined['e_email_id'] is not None:
+            review_dict['email_details'] = {
+                key[2:]: value for key, value in combined.items()
+                if key.startswith('e_')}
 
         return review_dict
 
@@ -191,7 +197,7 @@ class ReviewDashboard:
                     print(f"Order:    #{details['order_number']}")
                     print(f"Customer: {details['customer_email']}")
                     print(f"Reason:   {details['reason']}")
-                    print(f"Priority: {details['priority']}")
+                    print(f"Priority: {Priority.decode(details['priority'])}")
                     print(f"Created:  {details['created_at']}")
 
                     if 'email_details' in details:
@@ -3,52 +3,265 @@ Shopify Integration using Admin API
 Handles order lookups, status checks, fulfillment tracking
 """
 
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, Optional, List
 from datetime import datetime, timedelta
 import pytz
 
+# orjson decodes the multi-KB order payloads several times faster than
+# stdlib json and with less allocation; fall back when not installed
+try:
+    import orjson
+
+    def _json_loads(raw: bytes) -> Dict:
+        return orjson.loads(raw)
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    import json
+
+    def _json_loads(raw: bytes) -> Dict:
+        return json.loads(raw)
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+# ciso8601 parses Shopify's ISO8601 timestamps (trailing Z included) in
+# C, far faster than fromisoformat plus the replace() it needs on <3.11;
+# fall back to the stdlib when the extension isn't installed
+try:
+    from ciso8601 import parse_datetime
+except ImportError:
+    def parse_datetime(value: str) -> datetime:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+# (connect, read) timeout for every Shopify call so a hung socket
+# can't stall a processing cycle
+DEFAULT_TIMEOUT = (3.05, 15)
+
+# Delivery-window offsets applied to every formatted order; hoisted so
+# the per-order hot path doesn't rebuild the same timedeltas
+_MIN_DELIVERY = timedelta(days=10)
+_MAX_DELIVERY = timedelta(days=14)
+
+# Async twin of the pooled requests session, shared by all instances;
+# HTTP/2 multiplexes concurrent lookups over one TCP+TLS connection so
+# callers can asyncio.gather a whole batch of them
+_ASYNC_CLIENT = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+    timeout=15
+)
+
+# One GraphQL search that brings back every order a processing cycle
+# needs; the Admin API's cost-based limit is far more generous than
+# REST's requests-per-second bucket
+_BULK_ORDERS_QUERY = '''
+query ($q: String!, $first: Int!) {
+  orders(first: $first, query: $q) {
+    edges {
+      node {
+        legacyResourceId
+        name
+        email
+        createdAt
+        displayFulfillmentStatus
+        displayFinancialStatus
+        note
+        tags
+        totalPriceSet { shopMoney { amount currencyCode } }
+        customer { firstName lastName }
+        shippingAddress { address1 address2 city province zip country }
+        fulfillments { trackingInfo { number company url } }
+        lineItems(first: 20) {
+          edges { node { title quantity originalUnitPriceSet { shopMoney { amount } } } }
+        }
+      }
+    }
+  }
+}
+'''
+
+
+@dataclass(slots=True)
+class OrderInfo:
+    """
+    One formatted order. Slots pack the 17 fields flat instead of a
+    fresh 17-key dict per order; get/[] keep existing dict-style callers
+    working unchanged.
+    """
+    order_id: Optional[int] = None
+    order_number: str = ''
+    created_at: str = ''
+    order_date: str = ''
+    expected_delivery_min: str = ''
+    expected_delivery_max: str = ''
+    expected_delivery_max_epoch: int = 0
+    fulfillment_status: str = 'unfulfilled'
+    financial_status: str = 'pending'
+    total_price: str = '0.00'
+    currency: str = 'USD'
+    customer_email: str = ''
+    customer_name: str = ''
+    shipping_address: Dict = field(default_factory=dict)
+    tracking_info: List[Dict] = field(default_factory=list)
+    line_items: List[Dict] = field(default_factory=list)
+    note: str = ''
+    tags: str = ''
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+
 class ShopifyIntegration:
+    # Only the fields _format_order_info reads; the full REST order
+    # payload (metafields, discount/tax lines, ...) is often tens of KB
+    # and all of it would be downloaded and json-parsed just to be dropped
+    _ORDER_FIELDS = ('id,name,email,created_at,fulfillment_status,'
+                     'financial_status,total_price,currency,customer,'
+                     'shipping_address,fulfillments,line_items,note,tags')
+
     def __init__(self, shop_domain: str, access_token: str):
         self.shop_domain = shop_domain.replace('https://', '').replace('http://', '')
         self.access_token = access_token
         self.base_url = f"https://{self.shop_domain}/admin/api/2024-01"
 
-    def _make_request(self, endpoint: str, method: str = 'GET', data: Dict = None) -> Optional[Dict]:
+        # Pooled session with the auth header set once: keep-alive
+        # amortizes the TCP+TLS handshake across the several lookups each
+        # email costs, and transient 429/5xx responses retry with backoff
+        self.session = requests.Session()
+        self.session.headers.update({
+            'X-Shopify-Access-Token': access_token,
+            'Content-Type': 'application/json'
+        })
+        # 5xx retries live in the adapter; 429s are handled explicitly in
+        # _request_with_backoff where the leaky-bucket headers are visible
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.5,
+                              status_forcelist=[500, 502, 503, 504],
+                              allowed_methods=['GET', 'PUT', 'POST'])
+        ))
+
+        # Short-TTL cache for order-by-id lookups: check_if_delivered and
+        # get_fulfillment_status both re-fetch the same order within one
+        # cycle, and 60s of staleness is fine for status reads
+        self._order_cache: Dict[str, tuple] = {}
+        self._order_cache_ttl = 60
+        self._order_cache_max = 512
+
+        # Small pool so find_order_for_email can fire its email and
+        # number lookups together instead of serializing the fallback
+        self._lookup_pool = ThreadPoolExecutor(max_workers=4)
+
+    def _request_with_backoff(self, method: str, url: str, data: Dict = None,
+                              params: Dict = None,
+                              retries: int = 3) -> requests.Response:
+        """
+        Issue a request, honoring Shopify's leaky-bucket throttle:
+        a 429 sleeps out Retry-After and retries instead of failing the
+        lookup, and a bucket above 80% full adds a short proactive pause
+        so bursts don't tip into throttling at all
+        """
+        body = _json_dumps(data) if data is not None else None
+
+        for attempt in range(retries + 1):
+            response = self.session.request(method, url, data=body,
+                                            params=params, timeout=DEFAULT_TIMEOUT)
+
+            if response.status_code == 429 and attempt < retries:
+                wait = float(response.headers.get('Retry-After', '2'))
+                print(f"Shopify rate limited, retrying in {wait}s...")
+                time.sleep(wait)
+                continue
+
+            call_limit = response.headers.get('X-Shopify-Shop-Api-Call-Limit')
+            if call_limit:
+                try:
+                    used, limit = call_limit.split('/')
+                    if int(limit) and int(used) / int(limit) > 0.8:
+                        time.sleep(0.5)
+                except ValueError:
+                    pass
+
+            return response
+
+        return response
+
+    def _make_request(self, endpoint: str, method: str = 'GET', data: Dict = None,
+                      params: Dict = None) -> Optional[Dict]:
         """
         Make authenticated request to Shopify API
         """
-        headers = {
-            'X-Shopify-Access-Token': self.access_token,
-            'Content-Type': 'application/json'
-        }
+        if method not in ('GET', 'POST', 'PUT'):
+            return None
 
         url = f"{self.base_url}/{endpoint}"
 
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=headers)
-            elif method == 'POST':
-                response = requests.post(url, headers=headers, json=data)
-            elif method == 'PUT':
-                response = requests.put(url, headers=headers, json=data)
-            else:
-                return None
+            response = self._request_with_backoff(method, url, data, params)
+            response.raise_for_status()
+            return _json_loads(response.content)
+
+        except Exception as e:
+            print(f"Shopify API error: {e}")
+            return None
+
+    async def _make_request_async(self, endpoint: str, method: str = 'GET',
+                                  data: Dict = None,
+                                  params: Dict = None) -> Optional[Dict]:
+        """
+        Async counterpart of _make_request on the shared httpx client;
+        a 429 sleeps out Retry-After without blocking the event loop
+        """
+        if method not in ('GET', 'POST', 'PUT'):
+            return None
+
+        url = f"{self.base_url}/{endpoint}"
+        headers = {'X-Shopify-Access-Token': self.access_token,
+                   'Content-Type': 'application/json'}
+        body = _json_dumps(data) if data is not None else None
 
+        try:
+            response = await _ASYNC_CLIENT.request(method, url, content=body,
+                                                   params=params, headers=headers)
+            if response.status_code == 429:
+                wait = float(response.headers.get('Retry-After', '2'))
+                await asyncio.sleep(wait)
+                response = await _ASYNC_CLIENT.request(method, url, content=body,
+                                                       params=params,
+                                                       headers=headers)
             response.raise_for_status()
-            return response.json()
+            return _json_loads(response.content)
 
         except Exception as e:
             print(f"Shopify API error: {e}")
             return None
 
-    def find_order_by_email(self, email: str, limit: int = 10) -> List[Dict]:
+    def find_order_by_email(self, email: str, limit: int = 10) -> List[OrderInfo]:
         """
         Find orders by customer email
         Returns list of order summaries
         """
-        endpoint = f"orders.json?email={email}&limit={limit}&status=any"
-        result = self._make_request(endpoint)
+        result = self._make_request('orders.json', params={
+            'email': email, 'limit': limit, 'status': 'any',
+            'fields': self._ORDER_FIELDS})
 
         if not result or 'orders' not in result:
             return []
@@ -59,31 +272,198 @@ class ShopifyIntegration:
 
         return orders
 
-    def find_order_by_number(self, order_number: str) -> Optional[Dict]:
+    def find_order_by_number(self, order_number: str) -> Optional[OrderInfo]:
         """
         Find specific order by order number
         """
-        endpoint = f"orders.json?name=%23{order_number}&status=any"
-        result = self._make_request(endpoint)
+        result = self._make_request('orders.json', params={
+            'name': f'#{order_number}', 'status': 'any',
+            'fields': self._ORDER_FIELDS})
 
         if not result or 'orders' not in result or len(result['orders']) == 0:
             return None
 
         return self._format_order_info(result['orders'][0])
 
-    def get_order_by_id(self, order_id: str) -> Optional[Dict]:
+    async def find_order_by_email_async(self, email: str, limit: int = 10) -> List[OrderInfo]:
+        """
+        Async variant of find_order_by_email for asyncio.gather callers
+        """
+        result = await self._make_request_async('orders.json', params={
+            'email': email, 'limit': limit, 'status': 'any',
+            'fields': self._ORDER_FIELDS})
+
+        if not result or 'orders' not in result:
+            return []
+
+        return [self._format_order_info(order) for order in result['orders']]
+
+    async def find_order_by_number_async(self, order_number: str) -> Optional[OrderInfo]:
+        """
+        Async variant of find_order_by_number for asyncio.gather callers
+        """
+        result = await self._make_request_async('orders.json', params={
+            'name': f'#{order_number}', 'status': 'any',
+            'fields': self._ORDER_FIELDS})
+
+        if not result or 'orders' not in result or len(result['orders']) == 0:
+            return None
+
+        return self._format_order_info(result['orders'][0])
+
+    def find_order_for_email(self, order_number: Optional[str], email: str) -> Optional[OrderInfo]:
+        """
+        Resolve a customer's order: pull their recent orders by email
+        and match the order number client-side, with a direct number
+        lookup covering orders placed under a different address. Both
+        lookups fire together so the fallback doesn't serialize behind
+        the miss.
+        """
+        if not order_number:
+            orders = self.find_order_by_email(email)
+            return orders[0] if orders else None
+
+        email_future = self._lookup_pool.submit(self.find_order_by_email, email)
+        direct_future = self._lookup_pool.submit(self.find_order_by_number,
+                                                 order_number)
+
+        orders = email_future.result()
+        direct = direct_future.result()
+
+        for order in orders:
+            if order['order_number'] == str(order_number):
+                return order
+
+        if direct:
+            return direct
+
+        return orders[0] if orders else None
+
+    def find_orders_bulk(self, pairs: List[tuple]) -> List[OrderInfo]:
+        """
+        Fetch the orders for many (order_number, email) pairs in one
+        GraphQL round-trip; either element of a pair may be None
+        Returns formatted orders in the same shape as the REST lookups
+        """
+        terms = []
+        for order_number, email in pairs:
+            if order_number:
+                terms.append(f"name:#{order_number}")
+            if email:
+                terms.append(f"email:{email}")
+        if not terms:
+            return []
+
+        # dict.fromkeys dedupes while keeping order
+        query_string = ' OR '.join(dict.fromkeys(terms))
+        result = self._make_request('graphql.json', method='POST', data={
+            'query': _BULK_ORDERS_QUERY,
+            'variables': {'q': query_string, 'first': 50}
+        })
+
+        if not result or 'data' not in result:
+            return []
+
+        edges = (result['data'].get('orders') or {}).get('edges', [])
+        return [self._format_graphql_order(edge['node']) for edge in edges]
+
+    def _format_graphql_order(self, node: Dict) -> OrderInfo:
+        """
+        Map a GraphQL order node onto the REST field names and reuse
+        _format_order_info so both lookups return identical dicts
+        """
+        price_set = (node.get('totalPriceSet') or {}).get('shopMoney') or {}
+        customer = node.get('customer') or {}
+        tags = node.get('tags') or []
+
+        tracking = []
+        for fulfillment in node.get('fulfillments') or []:
+            for info in fulfillment.get('trackingInfo') or []:
+                tracking.append({
+                    'tracking_number': info.get('number'),
+                    'tracking_company': info.get('company', 'Unknown'),
+                    'tracking_url': info.get('url', '')
+                })
+
+        line_items = []
+        for edge in (node.get('lineItems') or {}).get('edges', []):
+            item = edge['node']
+            item_price = ((item.get('originalUnitPriceSet') or {})
+                          .get('shopMoney') or {})
+            line_items.append({
+                'name': item.get('title', ''),
+                'quantity': item.get('quantity', 1),
+                'price': item_price.get('amount', '0.00')
+            })
+
+        fulfillment_status = (node.get('displayFulfillmentStatus') or '').lower()
+        return self._format_order_info({
+            'id': node.get('legacyResourceId'),
+            'name': node.get('name') or '',
+            'created_at': node.get('createdAt') or '',
+            'fulfillment_status': fulfillment_status or None,
+            'financial_status': (node.get('displayFinancialStatus') or 'pending').lower(),
+            'total_price': price_set.get('amount', '0.00'),
+            'currency': price_set.get('currencyCode', 'USD'),
+            # GraphQL returns explicit nulls (e.g. email on POS/phone
+            # orders), which .get defaults don't cover
+            'email': node.get('email') or '',
+            'customer': {'first_name': customer.get('firstName') or '',
+                         'last_name': customer.get('lastName') or ''},
+            'shipping_address': node.get('shippingAddress') or {},
+            'fulfillments': tracking,
+            'line_items': line_items,
+            'note': node.get('note') or '',
+            'tags': ', '.join(tags) if isinstance(tags, list) else tags
+        })
+
+    def get_order_by_id(self, order_id: str) -> Optional[OrderInfo]:
         """
         Get order by Shopify order ID
+        Repeated lookups within the cache TTL are served from memory
         """
+        cached = self._order_cache.get(str(order_id))
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
         endpoint = f"orders/{order_id}.json"
-        result = self._make_request(endpoint)
+        result = self._make_request(endpoint,
+                                    params={'fields': self._ORDER_FIELDS})
+
+        if not result or 'order' not in result:
+            return None
+
+        order = self._format_order_info(result['order'])
+
+        if len(self._order_cache) >= self._order_cache_max:
+            now = time.monotonic()
+            self._order_cache = {k: v for k, v in self._order_cache.items()
+                                 if v[0] > now}
+        self._order_cache[str(order_id)] = (
+            time.monotonic() + self._order_cache_ttl, order)
+
+        return order
+
+    def bust_cache(self, order_id: str):
+        """
+        Drop a cached order after a mutation so the next read is fresh
+        """
+        self._order_cache.pop(str(order_id), None)
+
+    async def get_order_by_id_async(self, order_id: str) -> Optional[OrderInfo]:
+        """
+        Async variant of get_order_by_id for asyncio.gather callers
+        """
+        endpoint = f"orders/{order_id}.json"
+        result = await self._make_request_async(
+            endpoint, params={'fields': self._ORDER_FIELDS})
 
         if not result or 'order' not in result:
             return None
 
         return self._format_order_info(result['order'])
 
-    def _format_order_info(self, order: Dict) -> Dict:
+    def _format_order_info(self, order: Dict) -> OrderInfo:
         """
         Format order data into consistent structure
         """
@@ -91,9 +471,9 @@ class ShopifyIntegration:
         created_at = order.get('created_at', '')
 
         # Calculate expected delivery dates
-        order_date = datetime.fromisoformat(created_at.replace('Z', '+00:00')) if created_at else datetime.now(pytz.UTC)
-        expected_min = order_date + timedelta(days=10)
-        expected_max = order_date + timedelta(days=14)
+        order_date = parse_datetime(created_at) if created_at else datetime.now(pytz.UTC)
+        expected_min = order_date + _MIN_DELIVERY
+        expected_max = order_date + _MAX_DELIVERY
 
         # Get fulfillment status
         fulfillment_status = order.get('fulfillment_status') or 'unfulfilled'
@@ -119,25 +499,28 @@ class ShopifyIntegration:
                 'price': item.get('price', '0.00')
             })
 
-        return {
-            'order_id': order.get('id'),
-            'order_number': order_number,
-            'created_at': created_at,
-            'order_date': order_date.isoformat(),
-            'expected_delivery_min': expected_min.isoformat(),
-            'expected_delivery_max': expected_max.isoformat(),
-            'fulfillment_status': fulfillment_status,
-            'financial_status': order.get('financial_status', 'pending'),
-            'total_price': order.get('total_price', '0.00'),
-            'currency': order.get('currency', 'USD'),
-            'customer_email': order.get('email', ''),
-            'customer_name': f"{order.get('customer', {}).get('first_name', '')} {order.get('customer', {}).get('last_name', '')}".strip(),
-            'shipping_address': order.get('shipping_address', {}),
-            'tracking_info': tracking_info,
-            'line_items': line_items,
-            'note': order.get('note', ''),
-            'tags': order.get('tags', '')
-        }
+        return OrderInfo(
+            order_id=order.get('id'),
+            order_number=order_number,
+            created_at=created_at,
+            order_date=order_date.isoformat(),
+            expected_delivery_min=expected_min.isoformat(),
+            expected_delivery_max=expected_max.isoformat(),
+            # Epoch twin of expected_delivery_max so consumers can do plain
+            # arithmetic instead of re-parsing the ISO string
+            expected_delivery_max_epoch=int(expected_max.timestamp()),
+            fulfillment_status=fulfillment_status,
+            financial_status=order.get('financial_status', 'pending'),
+            total_price=order.get('total_price', '0.00'),
+            currency=order.get('currency', 'USD'),
+            customer_email=order.get('email', ''),
+            customer_name=f"{order.get('customer', {}).get('first_name', '')} {order.get('customer', {}).get('last_name', '')}".strip(),
+            shipping_address=order.get('shipping_address', {}),
+            tracking_info=tracking_info,
+            line_items=line_items,
+            note=order.get('note', ''),
+            tags=order.get('tags', '')
+        )
 
     def update_shipping_address(self, order_id: str, new_address: Dict) -> bool:
         """
@@ -152,7 +535,10 @@ class ShopifyIntegration:
         }
 
         result = self._make_request(endpoint, method='PUT', data=data)
-        return result is not None
+        if result is not None:
+            self.bust_cache(order_id)
+            return True
+        return False
 
     def get_fulfillment_status(self, order_id: str) -> Optional[str]:
         """
@@ -163,19 +549,29 @@ class ShopifyIntegration:
             return order.get('fulfillment_status', 'unfulfilled')
         return None
 
+    def _is_delivered_raw(self, order_json: Dict) -> bool:
+        """
+        Scan raw fulfillments for a delivered/out-for-delivery shipment,
+        returning on the first hit without formatting anything
+        """
+        for fulfillment in order_json.get('fulfillments') or []:
+            if fulfillment.get('tracking_number') and \
+                    fulfillment.get('shipment_status') in ('delivered', 'out_for_delivery'):
+                return True
+        return False
+
     def check_if_delivered(self, order_id: str) -> bool:
         """
         Check if order has been delivered based on tracking
+        Fetches only the fulfillments field - the yes/no answer doesn't
+        need the full formatted order
         """
-        order = self.get_order_by_id(order_id)
-        if not order or not order.get('tracking_info'):
+        result = self._make_request(f"orders/{order_id}.json",
+                                    params={'fields': 'fulfillments'})
+        if not result or 'order' not in result:
             return False
 
-        for tracking in order['tracking_info']:
-            if tracking.get('status') in ['delivered', 'out_for_delivery']:
-                return True
-
-        return False
+        return self._is_delivered_raw(result['order'])
 
 
 if __name__ == "__main__":
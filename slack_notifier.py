@@ -3,9 +3,39 @@ Slack Integration for Notifications
 Sends alerts to Slack for items needing human review
 """
 
+import threading
+
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import time
 from typing import Dict, Optional
-from datetime import datetime
+
+# orjson serializes attachment payloads faster than stdlib json;
+# fall back when not installed
+try:
+    import orjson
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    import json
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+# (connect, read) timeout for webhook POSTs so a hung socket can't
+# stall the caller
+DEFAULT_TIMEOUT = (3.05, 15)
+
+# Async twin of the session for event-loop callers; shared so all
+# notifier instances reuse one connection pool
+_ASYNC_CLIENT = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+    timeout=15
+)
 
 class SlackNotifier:
     def __init__(self, webhook_url: str):
@@ -17,6 +47,34 @@ class SlackNotifier:
         """
         self.webhook_url = webhook_url
 
+        # One session for the webhook host so back-to-back alerts reuse
+        # the TLS connection instead of re-handshaking
+        self.session = requests.Session()
+        self.session.headers['Content-Type'] = 'application/json'
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=4,
+            max_retries=Retry(total=3, backoff_factor=0.5,
+                              status_forcelist=[429, 500, 502, 503, 504],
+                              allowed_methods=['POST'])
+        ))
+
+        # Review alerts buffered within one bot cycle; flush() sends them
+        # as one message with N attachments instead of N webhook POSTs
+        self._pending_attachments = []
+        self._batch_lock = threading.Lock()
+
+        # Static attachment skeleton copied per notification; only the
+        # volatile fields are patched in on each send
+        self._att_template = {
+            "color": "#FFD700",
+            "title": "",
+            "text": "",
+            "fields": [],
+            "footer": "Support Bot",
+            "ts": 0
+        }
+
     def send_notification(self, title: str, message: str,
                          color: str = "#FFD700",
                          fields: Optional[list] = None) -> bool:
@@ -32,36 +90,45 @@ class SlackNotifier:
         Returns:
             True if sent successfully
         """
-        payload = {
-            "attachments": [
-                {
-                    "color": color,
-                    "title": title,
-                    "text": message,
-                    "fields": fields or [],
-                    "footer": "Support Bot",
-                    "ts": int(datetime.now().timestamp())
-                }
-            ]
-        }
+        attachment = self._att_template.copy()
+        attachment.update(color=color, title=title, text=message,
+                          fields=fields or [], ts=int(time.time()))
+        payload = {"attachments": [attachment]}
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 self.webhook_url,
-                json=payload,
-                headers={'Content-Type': 'application/json'}
+                data=_json_dumps(payload),
+                timeout=DEFAULT_TIMEOUT
             )
             return response.status_code == 200
         except Exception as e:
             print(f"Error sending Slack notification: {e}")
             return False
 
-    def notify_human_review_needed(self, order_number: str,
-                                   customer_email: str,
-                                   reason: str,
-                                   priority: str = "medium") -> bool:
+    async def send_notification_async(self, title: str, message: str,
+                                      color: str = "#FFD700",
+                                      fields: Optional[list] = None) -> bool:
         """
-        Send notification for item needing human review
+        Async variant of send_notification for asyncio.gather callers
+        """
+        attachment = self._att_template.copy()
+        attachment.update(color=color, title=title, text=message,
+                          fields=fields or [], ts=int(time.time()))
+        payload = {"attachments": [attachment]}
+
+        try:
+            response = await _ASYNC_CLIENT.post(self.webhook_url, json=payload)
+            return response.status_code == 200
+        except Exception as e:
+            print(f"Error sending Slack notification: {e}")
+            return False
+
+    def _review_fields(self, order_number: str, customer_email: str,
+                       reason: str, priority: str) -> tuple:
+        """
+        Build the (color, fields) pair shared by single and batched
+        review alerts
         """
         color_map = {
             'high': '#FF0000',
@@ -98,13 +165,80 @@ class SlackNotifier:
             }
         ]
 
+        return color_map.get(priority, '#FFD700'), fields
+
+    def notify_human_review_needed(self, order_number: str,
+                                   customer_email: str,
+                                   reason: str,
+                                   priority: str = "medium") -> bool:
+        """
+        Send notification for item needing human review
+        """
+        color, fields = self._review_fields(order_number, customer_email,
+                                            reason, priority)
+
         return self.send_notification(
             title="🚩 Human Review Needed",
             message="A customer support email requires your attention",
-            color=color_map.get(priority, '#FFD700'),
+            color=color,
             fields=fields
         )
 
+    def begin_batch(self):
+        """
+        Start a fresh review batch, dropping anything left unflushed
+        """
+        with self._batch_lock:
+            self._pending_attachments = []
+
+    def add_review(self, order_number: str, customer_email: str,
+                   reason: str, priority: str = "medium"):
+        """
+        Buffer one review alert; flush() sends the whole batch
+        Safe to call from worker threads
+        """
+        color, fields = self._review_fields(order_number, customer_email,
+                                            reason, priority)
+        attachment = self._att_template.copy()
+        attachment.update(
+            color=color,
+            title="🚩 Human Review Needed",
+            text="A customer support email requires your attention",
+            fields=fields,
+            ts=int(time.time())
+        )
+
+        with self._batch_lock:
+            self._pending_attachments.append(attachment)
+
+    def flush(self) -> bool:
+        """
+        Send all buffered review alerts as one message per 100
+        attachments (Slack's per-message cap)
+        """
+        with self._batch_lock:
+            pending = self._pending_attachments
+            self._pending_attachments = []
+
+        if not pending:
+            return True
+
+        all_ok = True
+        for start in range(0, len(pending), 100):
+            payload = {"attachments": pending[start:start + 100]}
+            try:
+                response = self.session.post(
+                    self.webhook_url,
+                    data=_json_dumps(payload),
+                    timeout=DEFAULT_TIMEOUT
+                )
+                all_ok = all_ok and response.status_code == 200
+            except Exception as e:
+                print(f"Error sending Slack notification: {e}")
+                all_ok = False
+
+        return all_ok
+
     def notify_error(self, error_message: str, context: str = "") -> bool:
         """
         Send error notification
@@ -0,0 +1,69 @@
+"""
+Shared integer codes for the intent and priority columns
+Small ints keep the indexes compact and make ORDER BY priority a plain
+integer comparison; legacy rows that still hold TEXT decode unchanged
+"""
+
+from enum import IntEnum
+from typing import Optional
+
+
+class Intent(IntEnum):
+    SPAM = 1
+    BLOCKED_SENDER = 2
+    TRACKING = 3
+    RETURN_REFUND = 4
+    DEFECTIVE = 5
+    ADDRESS_CHANGE = 6
+    SIZING = 7
+    GENERAL = 8
+
+    @classmethod
+    def encode(cls, label: Optional[str]) -> Optional[int]:
+        """Map an intent label to its code; unknown labels fall back to
+        GENERAL, None stays None"""
+        if label is None:
+            return None
+        try:
+            return int(cls[label.upper()])
+        except KeyError:
+            return int(cls.GENERAL)
+
+    @classmethod
+    def decode(cls, value) -> Optional[str]:
+        """Map a stored value back to its label; legacy TEXT rows pass
+        through as-is"""
+        if value is None:
+            return None
+        try:
+            return cls(int(value)).name.lower()
+        except (ValueError, TypeError):
+            return str(value)
+
+
+class Priority(IntEnum):
+    # Ordered so ORDER BY priority DESC ranks high above medium above
+    # low (the old TEXT columns collated 'medium' > 'low' > 'high')
+    LOW = 1
+    MEDIUM = 2
+    HIGH = 3
+
+    @classmethod
+    def encode(cls, label: Optional[str]) -> int:
+        """Map a priority label to its code; unknown labels count as
+        MEDIUM like the queue default"""
+        try:
+            return int(cls[(label or 'medium').upper()])
+        except KeyError:
+            return int(cls.MEDIUM)
+
+    @classmethod
+    def decode(cls, value) -> Optional[str]:
+        """Map a stored value back to its label; legacy TEXT rows pass
+        through as-is"""
+        if value is None:
+            return None
+        try:
+            return cls(int(value)).name.lower()
+        except (ValueError, TypeError):
+            return str(value)
@@ -62,8 +62,11 @@ print("="*60)
 passed = 0
 failed = 0
 
-for test in test_cases:
-    is_blocked, reason = agent.is_blocked_sender(test['email'], test['name'])
+# One bulk call; duplicate senders are deduped by the agent's cache
+results = agent.is_blocked_sender_bulk(
+    [(test['email'], test['name']) for test in test_cases])
+
+for test, (is_blocked, reason) in zip(test_cases, results):
     expected = test['should_block']
 
     status = "✅ PASS" if is_blocked == expected else "❌ FAIL"
@@ -3,6 +3,9 @@ Test script to run bot once
 """
 
 import os
+import queue
+import threading
+from threading import Lock
 from dotenv import load_dotenv
 from outlook_email_handler import OutlookEmailHandler
 from shopify_integration import ShopifyIntegration
@@ -42,114 +45,185 @@ if not email_handler.authenticate():
     exit(1)
 print("✅ Authenticated\n")
 
-# Get unread emails
-print("📧 Fetching unread emails...")
-emails = email_handler.get_unread_emails(limit=5)
-print(f"✅ Found {len(emails)} unread email(s)\n")
-
-if not emails:
-    print("📭 No unread emails to process")
-    exit(0)
-
-# Process first email
-for i, email in enumerate(emails, 1):
-    print(f"\n{'='*60}")
-    print(f"📨 EMAIL #{i}")
-    print(f"{'='*60}")
-    print(f"From: {email['from_name']} <{email['from_email']}>")
-    print(f"Subject: {email['subject']}")
-    print(f"Received: {email['received_time']}")
-    print(f"\nBody Preview: {email['body'][:200]}...")
-
-    # Classify email
-    classification = ai_agent.classify_email_intent(email['body'], email['subject'])
-    print(f"\n🔍 Classification: {classification['intent']}")
-
-    if classification['is_spam']:
-        print("🚫 Marked as SPAM - skipping")
-        email_handler.mark_as_read(email['id'])
-        continue
-
-    # Try to find order info
-    print("\n🛍️  Looking up order information...")
-    order_number = ai_agent.extract_order_number(email['body'] + " " + email['subject'])
-
-    order_context = None
-    if order_number:
-        print(f"   Found order number: #{order_number}")
-        order_context = shopify.find_order_by_number(order_number)
+# Emails stream through a bounded queue: the producer pages the inbox
+# and prepares each page (blocked flags + one bulk order prefetch),
+# while the workers already classify, generate, and reply to earlier
+# pages - fetch latency hides behind processing latency
+EMAIL_LIMIT = 5
+WORKERS = 4
+
+work_queue = queue.Queue(maxsize=16)
+print_lock = Lock()
+
+
+def producer():
+    seen = 0
+    try:
+        for page in email_handler.iter_unread_pages(limit=EMAIL_LIMIT):
+            with print_lock:
+                print(f"📧 Fetched a page of {len(page)} unread email(s)")
+
+            # One bulk call for the senders (deduped by the agent's cache)
+            # and one GraphQL round-trip for every order on the page
+            blocked = ai_agent.is_blocked_sender_bulk(
+                [(e['from_email'], e['from_name']) for e in page])
+            numbers = [ai_agent.extract_order_number(e['body'] + " " + e['subject'])
+                       for e in page]
+            prefetched = shopify.find_orders_bulk(
+                list(zip(numbers, (e['from_email'] for e in page))))
+
+            orders_by_number = {o['order_number']: o for o in prefetched}
+            orders_by_email = {}
+            for o in prefetched:
+                orders_by_email.setdefault(o['customer_email'].lower(), []).append(o)
+
+            for email, flag, number in zip(page, blocked, numbers):
+                order_context = orders_by_number.get(number) if number else None
+                if not order_context:
+                    matches = orders_by_email.get(email['from_email'].lower())
+                    if matches:
+                        order_context = matches[0]
+
+                seen += 1
+                work_queue.put((seen, email, flag, number, order_context))
+    except Exception as e:
+        with print_lock:
+            print(f"❌ Error fetching/preparing emails: {e}")
+    finally:
+        # One sentinel per worker, posted even if page prep blew up, so
+        # the consumers always drain and t.join() can't hang
+        for _ in range(WORKERS):
+            work_queue.put(None)
+
+    if seen == 0:
+        with print_lock:
+            print("📭 No unread emails to process")
+
+
+def process_email(i, email, blocked_flag, order_number, order_context):
+    out = []
+
+    out.append(f"\n{'='*60}")
+    out.append(f"📨 EMAIL #{i}")
+    out.append(f"{'='*60}")
+    out.append(f"From: {email['from_name']} <{email['from_email']}>")
+    out.append(f"Subject: {email['subject']}")
+    out.append(f"Received: {email['received_time']}")
+    out.append(f"\nBody Preview: {email['body'][:200]}...")
+
+    try:
+        is_blocked, block_reason = blocked_flag
+        if is_blocked:
+            out.append(f"\n🚫 Blocked sender ({block_reason}) - skipping")
+            email_handler.mark_as_read(email['id'])
+            return
+
+        # Classify email
+        classification = ai_agent.classify_email_intent(email['body'], email['subject'])
+        out.append(f"\n🔍 Classification: {classification['intent']}")
+
+        if classification['is_spam']:
+            out.append("🚫 Marked as SPAM - skipping")
+            email_handler.mark_as_read(email['id'])
+            return
+
+        # The producer already matched this email against the prefetch
+        out.append("\n🛍️  Looking up order information...")
+        if order_number:
+            out.append(f"   Found order number: #{order_number}")
+
         if order_context:
-            print(f"   ✅ Order found - Status: {order_context.get('fulfillment_status')}")
-        else:
-            print(f"   ⚠️  Order not found, trying email lookup...")
-            orders = shopify.find_order_by_email(email['from_email'])
-            if orders:
-                order_context = orders[0]
-                print(f"   ✅ Found order #{order_context.get('order_number')}")
-    else:
-        print("   No order number found, searching by email...")
-        orders = shopify.find_order_by_email(email['from_email'])
-        if orders:
-            order_context = orders[0]
-            print(f"   ✅ Found order #{order_context.get('order_number')}")
+            out.append(f"   ✅ Order #{order_context.get('order_number')} - "
+                       f"Status: {order_context.get('fulfillment_status')}")
         else:
-            print("   ⚠️  No orders found")
-
-    # Generate AI response
-    print("\n🤖 Generating AI response...")
-    response = ai_agent.generate_response(
-        customer_email=email['from_email'],
-        customer_name=email['from_name'],
-        email_subject=email['subject'],
-        email_body=email['body'],
-        order_context=order_context
-    )
-
-    print(f"\n{'='*60}")
-    print("📝 AI RESPONSE")
-    print(f"{'='*60}")
-    print(f"Type: {response['type']}")
-    print(f"Should Send: {response['should_send']}")
-    print(f"Flag for Human: {response['flag_for_human']}")
-
-    if response.get('human_review_reason'):
-        print(f"Reason: {response['human_review_reason']}")
-
-    if response.get('response'):
-        print(f"\nResponse Text:\n{response['response'][:500]}...")
-
-    # Take action
-    if response['flag_for_human']:
-        print(f"\n🚩 FLAGGED FOR HUMAN REVIEW")
-        if slack:
-            slack.notify_human_review_needed(
-                order_number=order_context.get('order_number', 'Unknown') if order_context else 'Unknown',
-                customer_email=email['from_email'],
-                reason=response['human_review_reason'],
-                priority='high'
+            out.append("   ⚠️  No orders found")
+
+        # Generate AI response
+        out.append("\n🤖 Generating AI response...")
+        response = ai_agent.generate_response(
+            customer_email=email['from_email'],
+            customer_name=email['from_name'],
+            email_subject=email['subject'],
+            email_body=email['body'],
+            order_context=order_context
+        )
+
+        out.append(f"\n{'='*60}")
+        out.append("📝 AI RESPONSE")
+        out.append(f"{'='*60}")
+        out.append(f"Type: {response['type']}")
+        out.append(f"Should Send: {response['should_send']}")
+        out.append(f"Flag for Human: {response['flag_for_human']}")
+
+        if response.get('human_review_reason'):
+            out.append(f"Reason: {response['human_review_reason']}")
+
+        if response.get('response'):
+            out.append(f"\nResponse Text:\n{response['response'][:500]}...")
+
+        # Take action
+        if response['flag_for_human']:
+            out.append(f"\n🚩 FLAGGED FOR HUMAN REVIEW")
+            if slack:
+                slack.add_review(
+                    order_number=order_context.get('order_number', 'Unknown') if order_context else 'Unknown',
+                    customer_email=email['from_email'],
+                    reason=response['human_review_reason'],
+                    priority='high'
+                )
+                out.append("   ✅ Slack notification queued")
+
+        elif response['should_send'] and response.get('response'):
+            out.append(f"\n📤 SENDING REPLY...")
+            subject = f"RE: {email['subject']}" if not email['subject'].startswith('RE:') else email['subject']
+
+            sent = email_handler.send_reply(
+                to_email=email['from_email'],
+                subject=subject,
+                body=response['response'],
+                original_message_id=email['id']
             )
-            print("   ✅ Slack notification sent")
 
-    elif response['should_send'] and response.get('response'):
-        print(f"\n📤 SENDING REPLY...")
-        subject = f"RE: {email['subject']}" if not email['subject'].startswith('RE:') else email['subject']
+            if sent:
+                out.append("   ✅ Reply sent successfully")
+                email_handler.mark_as_read(email['id'])
+                out.append("   ✅ Marked as read")
+            else:
+                out.append("   ❌ Failed to send reply")
+        else:
+            out.append("\n⏸️  No action taken (spam or error)")
 
-        sent = email_handler.send_reply(
-            to_email=email['from_email'],
-            subject=subject,
-            body=response['response'],
-            original_message_id=email['id']
-        )
+        out.append(f"\n{'='*60}\n")
+
+    except Exception as e:
+        out.append(f"\n❌ Error processing email: {e}")
+    finally:
+        with print_lock:
+            print('\n'.join(out))
 
-        if sent:
-            print("   ✅ Reply sent successfully")
-            email_handler.mark_as_read(email['id'])
-            print("   ✅ Marked as read")
-        else:
-            print("   ❌ Failed to send reply")
-    else:
-        print("\n⏸️  No action taken (spam or error)")
 
-    print(f"\n{'='*60}\n")
+def worker():
+    while True:
+        item = work_queue.get()
+        if item is None:
+            break
+        process_email(*item)
+
+
+# The shared sessions (Graph, Shopify, Slack) are all thread-safe
+if slack:
+    slack.begin_batch()
+
+print("📧 Fetching unread emails...")
+threads = [threading.Thread(target=producer)]
+threads += [threading.Thread(target=worker) for _ in range(WORKERS)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+
+# One webhook POST for every review flagged this cycle
+if slack:
+    slack.flush()
 
 print("\n✅ Processing complete!")
@@ -3,7 +3,11 @@ Test Setup Script
 Verifies all API connections and environment variables
 """
 
+import io
 import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 def test_environment_variables():
@@ -201,25 +205,35 @@ def test_database():
 
         db_path = os.getenv('DB_PATH', 'support_bot.db')
 
-        conn = sqlite3.connect(db_path)
+        # Same journal settings the bot runs with, and one transaction
+        # for the whole probe so it costs a single durable write instead
+        # of an fsync per commit
+        conn = sqlite3.connect(db_path, isolation_level=None)
         cursor = conn.cursor()
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS test_table (
-                id INTEGER PRIMARY KEY,
-                test_value TEXT
-            )
-        ''')
-
-        cursor.execute("INSERT INTO test_table (test_value) VALUES (?)", ("test",))
-        conn.commit()
-
-        cursor.execute("SELECT * FROM test_table")
-        result = cursor.fetchone()
-
-        cursor.execute("DROP TABLE test_table")
-        conn.commit()
-        conn.close()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS test_table (
+                    id INTEGER PRIMARY KEY,
+                    test_value TEXT
+                )
+            ''')
+
+            cursor.execute("INSERT INTO test_table (test_value) VALUES (?)", ("test",))
+
+            cursor.execute("SELECT * FROM test_table")
+            result = cursor.fetchone()
+
+            cursor.execute("DROP TABLE test_table")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
 
         if result:
             print(f"✅ Database working: {db_path}")
@@ -250,10 +264,45 @@ def main():
         print("Please check your .env file")
         return
 
-    results['outlook'] = test_outlook_connection()
-    results['shopify'] = test_shopify_connection()
-    results['anthropic'] = test_anthropic_api()
-    results['slack'] = test_slack_webhook()
+    # The four network probes are independent and dominated by TLS
+    # handshakes and API round-trips; running them together makes the
+    # wall time the slowest probe instead of the sum. Each worker's
+    # prints land in a per-thread buffer and are replayed in order.
+    probes = [
+        ('outlook', test_outlook_connection),
+        ('shopify', test_shopify_connection),
+        ('anthropic', test_anthropic_api),
+        ('slack', test_slack_webhook),
+    ]
+
+    buffers = {}
+    real_stdout = sys.stdout
+    local = threading.local()
+
+    class ThreadBufferedStdout:
+        def write(self, text):
+            getattr(local, 'buffer', real_stdout).write(text)
+
+        def flush(self):
+            getattr(local, 'buffer', real_stdout).flush()
+
+    def run_probe(name, probe):
+        local.buffer = buffers[name] = io.StringIO()
+        return probe()
+
+    sys.stdout = ThreadBufferedStdout()
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = {name: executor.submit(run_probe, name, probe)
+                       for name, probe in probes}
+            for name, future in futures.items():
+                results[name] = future.result()
+    finally:
+        sys.stdout = real_stdout
+
+    for name, _ in probes:
+        print(buffers[name].getvalue(), end='')
+
     results['database'] = test_database()
 
     print("\n" + "="*60)